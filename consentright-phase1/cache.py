@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+class SemanticCache:
+    """Return earlier recommendations for paraphrased symptom descriptions.
+
+    Embeddings are L2-normalised, so one matrix-vector product gives the cosine
+    similarity against every cached entry. The buffer holds at most max_entries
+    rows and overwrites the oldest one when full (FIFO).
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", threshold=0.92, max_entries=1024):
+        if SentenceTransformer is None:
+            raise ImportError("The semantic cache needs numpy and sentence-transformers (pip install sentence-transformers)")
+        self._model = SentenceTransformer(model_name)
+        self._threshold = threshold
+        self._embeddings = np.zeros((max_entries, self._model.get_sentence_embedding_dimension()), dtype=np.float32)
+        self._results = [None] * max_entries
+        self._count = 0
+        self._next = 0
+
+    def embed(self, symptoms):
+        return self._model.encode(symptoms, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, embedding):
+        if self._count == 0:
+            return None
+        sims = self._embeddings[:self._count] @ embedding
+        best = int(sims.argmax())
+        if sims[best] <= self._threshold:
+            return None
+        return self._results[best]
+
+    def add(self, embedding, result):
+        self._embeddings[self._next] = embedding
+        self._results[self._next] = result
+        self._next = (self._next + 1) % len(self._results)
+        self._count = min(self._count + 1, len(self._results))
+
+class CacheStore:
+    """Persistent key/value backing for the exact tier, kept across restarts.
+
+    One sqlite table keyed on the exact-tier hash, holding the result as JSON
+    and the time it was written. WAL mode lets several processes (an interactive
+    session and a batch run) share the file. Rows older than max_age_days are
+    deleted when the store is opened.
+    """
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".consentright", "cache.sqlite")
+
+    def __init__(self, path=DEFAULT_PATH, max_age_days=30):
+        # Results restate the user's symptoms, so the directory and files are private to the user.
+        os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        # Only ever used from the thread running the event loop; the flag allows creating it elsewhere.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # sqlite gives the -wal/-shm files the database's mode; tighten files left by older versions too.
+        for name in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(name):
+                os.chmod(name, 0o600)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (hash TEXT PRIMARY KEY, json TEXT, ts INTEGER)")
+        with self._conn:
+            self._conn.execute("DELETE FROM kv WHERE ts < ?", (int(time.time()) - max_age_days * 86400,))
+
+    def get(self, key):
+        row = self._conn.execute("SELECT json FROM kv WHERE hash = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, result):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO kv (hash, json, ts) VALUES (?, ?, ?)",
+                               (key, json.dumps(result), int(time.time())))
+
+    def close(self):
+        self._conn.close()
+
+class ConsultationCache:
+    """Two-tier cache in front of the LLM: exact match first, then semantic.
+
+    The exact tier is an LRU keyed on the case- and whitespace-normalised
+    symptoms plus a caller-supplied namespace (the prompt and model), so a
+    repeat costs one hash. An optional CacheStore persists that tier on disk,
+    and is read on an in-memory miss. The optional SemanticCache tier is only
+    consulted on an exact miss. Fallback and truncated recommendations are
+    never stored, so a retry after an API error makes a fresh request.
+    """
+
+    def __init__(self, max_entries=512, semantic=None, persistent=None, namespace=''):
+        self._exact = OrderedDict()
+        self._max_entries = max_entries
+        self.semantic = semantic
+        self.persistent = persistent
+        # Mixed into every key so answers from another prompt or model are never served;
+        # persisted rows from an older namespace are simply not found and age out.
+        self._namespace = namespace
+
+    def _key(self, symptoms):
+        text = self._namespace + '\0' + ' '.join(symptoms.lower().split())
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def lookup(self, symptoms):
+        # Returns (result, embedding); pass the embedding back to store() so a miss is embedded once.
+        key = self._key(symptoms)
+        result = self._exact.get(key)
+        if result is not None:
+            self._exact.move_to_end(key)
+            return result, None
+        if self.persistent is not None:
+            result = self.persistent.get(key)
+            if result is not None:
+                self._remember(key, result)
+                return result, None
+        if self.semantic is None:
+            return None, None
+        embedding = self.semantic.embed(symptoms)
+        return self.semantic.lookup(embedding), embedding
+
+    def store(self, symptoms, result, embedding=None):
+        if result.get('is_fallback') or result.get('is_incomplete'):
+            return
+        key = self._key(symptoms)
+        self._remember(key, result)
+        if self.persistent is not None:
+            self.persistent.put(key, result)
+        if embedding is not None:
+            self.semantic.add(embedding, result)
+
+    def _remember(self, key, result):
+        self._exact[key] = result
+        if len(self._exact) > self._max_entries:
+            self._exact.popitem(last=False)
@@ -1,23 +1,37 @@
+from typing import NamedTuple, Tuple
+from keyword_matcher import KeywordMatcher
+
+class ErrorInfo(NamedTuple):
+    category: str
+    message: str
+    suggestions: Tuple[str, ...]
+    retryable: bool
+
+# Checked in priority order: when keywords from several categories match, the earlier category wins.
+# The flag says whether the failure is transient, so the same single scan also drives retry decisions.
+_CATEGORIES = [
+    ("network", ['timeout', 'connection', 'network', 'unreachable'], True, "Network connection issue.", ("Check your internet connection", "Try again later")),
+    ("auth", ['api key', 'authentication', 'unauthorized', 'forbidden'], False, "API authentication issue.", ("Verify your GEMINI_API_KEY", "Check API permissions")),
+    ("rate_limit", ['rate limit', 'quota', 'too many requests'], True, "API rate limit exceeded.", ("Wait before trying again",)),
+    ("service", ['service unavailable', 'server error', 'internal error'], True, "AI service unavailable.", ("Try again later",)),
+    ("input", ['invalid', 'validation', 'parse', 'format'], False, "Input processing issue.", ("Rephrase your symptoms",)),
+]
+# Immutable and shared between calls; nothing is allocated per categorization.
+_ERROR_INFO = [ErrorInfo(c, m, s, r) for c, _, r, m, s in _CATEGORIES]
+_UNKNOWN_INFO = ErrorInfo("unknown", "Unexpected error.", ("Try again", "Restart the app"), True)
+_MATCHER = KeywordMatcher((k, i) for i, (_, keywords, *_) in enumerate(_CATEGORIES) for k in keywords)
+
 def categorize_error(error):
-    error_str = str(error).lower()
-    if any(k in error_str for k in ['timeout', 'connection', 'network', 'unreachable']):
-        return {"category": "network", "message": "Network connection issue.", "suggestions": ["Check your internet connection", "Try again later"]}
-    if any(k in error_str for k in ['api key', 'authentication', 'unauthorized', 'forbidden']):
-        return {"category": "auth", "message": "API authentication issue.", "suggestions": ["Verify your GEMINI_API_KEY", "Check API permissions"]}
-    if any(k in error_str for k in ['rate limit', 'quota', 'too many requests']):
-        return {"category": "rate_limit", "message": "API rate limit exceeded.", "suggestions": ["Wait before trying again"]}
-    if any(k in error_str for k in ['service unavailable', 'server error', 'internal error']):
-        return {"category": "service", "message": "AI service unavailable.", "suggestions": ["Try again later"]}
-    if any(k in error_str for k in ['invalid', 'validation', 'parse', 'format']):
-        return {"category": "input", "message": "Input processing issue.", "suggestions": ["Rephrase your symptoms"]}
-    return {"category": "unknown", "message": "Unexpected error.", "suggestions": ["Try again", "Restart the app"]}
+    priority = min(_MATCHER.iter_tags(str(error)), default=None)
+    if priority is None:
+        return _UNKNOWN_INFO
+    return _ERROR_INFO[priority]
 
 def _display_error_with_guidance(error, attempt_number=1):
     info = categorize_error(error)
-    print(f"\n❌ {info['message']}")
+    print(f"\n❌ {info.message}")
     print("\nSuggestions:")
-    for s in info['suggestions']:
+    for s in info.suggestions:
         print(f"   • {s}")
     if attempt_number >= 3:
         print("\nIf urgent, contact a doctor or emergency services.")
-
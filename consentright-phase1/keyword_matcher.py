@@ -0,0 +1,42 @@
+import re
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+class KeywordMatcher:
+    """Single-pass, case-insensitive multi-keyword scanner.
+
+    Built once from (keyword, tag) pairs. Uses a pyahocorasick automaton when
+    the package is installed, otherwise one compiled regex alternation; either
+    way the text is walked left to right once in C instead of once per keyword.
+    """
+
+    def __init__(self, tagged_keywords):
+        pairs = [(keyword.lower(), tag) for keyword, tag in tagged_keywords]
+        self._tags = dict(pairs)
+        self._first_chars = frozenset(c for k in self._tags for c in (k[0], k[0].upper()))
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, tag in pairs:
+                self._automaton.add_word(keyword, tag)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            # Lookahead so matches starting inside another match are still reported,
+            # like the automaton does; longest keywords first at each position.
+            # ASCII-only case folding lets the regex match the raw text without a lowered copy.
+            alternation = '|'.join(re.escape(k) for k in sorted(self._tags, key=len, reverse=True))
+            self._pattern = re.compile(f'(?=({alternation}))', re.IGNORECASE | re.ASCII)
+
+    def iter_tags(self, text):
+        # Cheap C-level prefilter: no keyword can start in a text holding none of their first characters.
+        if self._first_chars.isdisjoint(text):
+            return
+        if self._automaton is not None:
+            # The automaton is case-sensitive, so it needs the lowered text.
+            for _, tag in self._automaton.iter(text.lower()):
+                yield tag
+        else:
+            for match in self._pattern.finditer(text):
+                yield self._tags[match.group(1).lower()]
@@ -1,78 +1,303 @@
+import asyncio
+import functools
+import hashlib
 import json
+import logging
+import random
 import re
+import threading
+import time
+from collections import OrderedDict
 from langchain_google_genai import ChatGoogleGenerativeAI
-from prompts import CONSULTATION_PROMPT
+from prompts import CONSULTATION_TEMPLATE, build_messages
+from error_handling import categorize_error
+from keyword_matcher import KeywordMatcher
+from validation import normalize_whitespace
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+_HIGH_URGENCY_KEYWORDS = ['chest pain', 'breathing', 'severe', 'blood']
+_URGENCY_MATCHER = KeywordMatcher((k, "High") for k in _HIGH_URGENCY_KEYWORDS)
+_RE_CODE_BLOCK = re.compile(r'```(?:json)?\s*([\s\S]+?)\s*```')
+
+# Both helpers are pure str -> str, so resubmitted symptoms (e.g. after a network error) skip the work.
+# A ValueError from _clean_symptoms is not cached; lru_cache only stores returned values.
+@functools.lru_cache(maxsize=256)
+def _clean_symptoms(symptoms):
+    # Collapsed text is shorter than 3 chars exactly when the stripped text is.
+    cleaned = normalize_whitespace(symptoms) if symptoms else ''
+    if len(cleaned) < 3:
+        raise ValueError("Please provide more details about your symptoms")
+    return cleaned[:1000]
+
+@functools.lru_cache(maxsize=256)
+def _assess_basic_urgency(symptoms):
+    # The first high-urgency keyword hit settles it; no need to scan the rest.
+    for urgency in _URGENCY_MATCHER.iter_tags(symptoms):
+        return urgency
+    return "Medium"
+
+# String literals are consumed whole (an unterminated one runs to the end), so brackets inside them never count.
+_RE_JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?|[{}\[\],]', re.S)
+
+def _extract_json(text):
+    # One forward pass from the first '{' to the brace that closes it; anything after is ignored.
+    # Returns (json_str, cut). cut is None when the object closed; for a truncated object it is
+    # the offset just past the last complete top-level member, so json_str[:cut] + '}' is balanced.
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON found")
+    depth = 0
+    cut = None
+    for token in _RE_JSON_TOKEN.finditer(text, start):
+        c = token.group()
+        if c == '{' or c == '[':
+            depth += 1
+        elif c == '}' or c == ']':
+            depth -= 1
+            if depth == 0:
+                return text[start:token.end()], None
+            if depth == 1:
+                cut = token.end() - start
+        elif c == ',' and depth == 1:
+            cut = token.start() - start
+    return text[start:], cut
+
+def _response_text(message):
+    return message.content if hasattr(message, 'content') else str(message)
+
+def _new_llm(api_key, model):
+    return ChatGoogleGenerativeAI(
+        google_api_key=api_key,
+        model=model,
+        temperature=0.3,
+        max_output_tokens=1024,
+        # The prompt's static part is sent as a system instruction, which gemini-pro does not support
+        convert_system_message_to_human=(model == "gemini-pro")
+    )
+
+def _create_llm(api_key):
+    try:
+        return _new_llm(api_key, "gemini-2.5-flash")
+    except Exception:
+        return _new_llm(api_key, "gemini-pro")
+
+# Recently built clients, keyed by key hash so the raw key isn't kept around; instances
+# with the same key share one, along with the model it resolved to.
+_LLMS = OrderedDict()
+_LLMS_LOCK = threading.Lock()
+_LLMS_MAXSIZE = 8
+
+def _get_llm(api_key):
+    key = hashlib.sha256(api_key.encode()).hexdigest()
+    with _LLMS_LOCK:
+        llm = _LLMS.get(key)
+        if llm is not None:
+            _LLMS.move_to_end(key)
+            return llm
+        llm = _create_llm(api_key)
+        _LLMS[key] = llm
+        if len(_LLMS) > _LLMS_MAXSIZE:
+            _LLMS.popitem(last=False)
+        return llm
 
 class ConsultationLLM:
-    def __init__(self, api_key):
+    def __init__(self, api_key, max_retries=3, retry_delay=1.0, cache=None):
         if not api_key:
             raise ValueError("API key is required")
+        self.llm = _get_llm(api_key)
+        self.max_retries = max(1, int(max_retries))
+        self.retry_delay = float(retry_delay)
+        # Optional cache.ConsultationCache consulted by every process/stream method before the API.
+        self.cache = cache
+
+    @property
+    def cache_namespace(self):
+        # Cached answers are only valid for the prompt and model that produced them.
+        model = getattr(self.llm, 'model', '')
+        return hashlib.blake2b(f"{model}\0{CONSULTATION_TEMPLATE}".encode(), digest_size=8).hexdigest()
+
+    async def awarmup(self, timeout=2.0):
+        # A free count_tokens call opens the connection astream_symptoms will use, so the first
+        # consultation doesn't pay the handshake. The async client only exists when the chat model
+        # was built inside a running loop; otherwise astream runs the sync client in an executor,
+        # so that is the one warmed. Failures surface on the real call instead.
+        client = getattr(self.llm, 'async_client', None)
         try:
-            self.llm = ChatGoogleGenerativeAI(
-                google_api_key=api_key,
-                model="gemini-2.5-flash",
-                temperature=0.3,
-                max_output_tokens=1024
-            )
-        except Exception:
-            self.llm = ChatGoogleGenerativeAI(
-                google_api_key=api_key,
-                model="gemini-pro",
-                temperature=0.3,
-                max_output_tokens=1024
-            )
-        self.chain = CONSULTATION_PROMPT | self.llm
+            if client is not None:
+                call = client.count_tokens(model=self.llm.model, contents=[{"parts": [{"text": "ping"}]}])
+            else:
+                call = asyncio.get_running_loop().run_in_executor(None, self.llm.get_num_tokens, "ping")
+            await asyncio.wait_for(call, timeout)
+        except Exception as e:
+            logger.debug("Warmup request failed: %r", e)
 
     def process_symptoms(self, symptoms):
         cleaned_symptoms = self._clean_input(symptoms)
+        cached, embedding = self._cache_lookup(cleaned_symptoms)
+        if cached is not None:
+            return cached
+        try:
+            result = self._invoke_with_retry(build_messages(cleaned_symptoms))
+        except Exception as e:
+            return self._fail(cleaned_symptoms, e)
+        return self._finish(cleaned_symptoms, _response_text(result), embedding)
+
+    async def astream_symptoms(self, symptoms, on_chunk, on_miss=None):
+        # Each text chunk goes to on_chunk as it arrives so callers can show progress from the
+        # first token; async generators cannot return a value, so the recommendation is returned.
+        # A cache hit returns it without calling on_chunk; on_miss runs just before the request.
+        cleaned_symptoms = self._clean_input(symptoms)
+        cached, embedding = self._cache_lookup(cleaned_symptoms)
+        if cached is not None:
+            return cached
+        if on_miss is not None:
+            on_miss()
+        chunks = []
         try:
-            result = self.chain.invoke({"symptoms": cleaned_symptoms})
-            response = result.content if hasattr(result, 'content') else str(result)
-            print("\n[DEBUG] Raw LLM response:\n", response)
-            return self._parse_response(response)
+            async for chunk in self._astream_with_retry(build_messages(cleaned_symptoms)):
+                text = _response_text(chunk)
+                chunks.append(text)
+                on_chunk(text)
         except Exception as e:
-            import traceback
-            print("[DEBUG] Exception in LLM call or parsing:")
-            print("Type:", type(e))
-            print("Message:", e)
-            print("Traceback:")
-            traceback.print_exc()
-            return self._fallback_recommendation(cleaned_symptoms, str(e))
+            return self._fail(cleaned_symptoms, e)
+        return self._finish(cleaned_symptoms, ''.join(chunks), embedding)
+
+    async def aprocess_symptoms(self, symptoms):
+        # Async twin of process_symptoms; awaiting ainvoke lets callers run several
+        # consultations concurrently with asyncio.gather.
+        cleaned_symptoms = self._clean_input(symptoms)
+        cached, embedding = self._cache_lookup(cleaned_symptoms)
+        if cached is not None:
+            return cached
+        try:
+            result = await self._ainvoke_with_retry(build_messages(cleaned_symptoms))
+        except Exception as e:
+            return self._fail(cleaned_symptoms, e)
+        return self._finish(cleaned_symptoms, _response_text(result), embedding)
+
+    def process_symptoms_batch(self, symptoms_list, max_concurrency=8):
+        # One llm.batch call fans the requests out concurrently instead of one round trip each.
+        # Per-item failures fall back individually, like process_symptoms does; cache hits skip the batch.
+        cleaned_list = [self._clean_input(s) for s in symptoms_list]
+        lookups = [self._cache_lookup(c) for c in cleaned_list]
+        misses = [i for i, (cached, _) in enumerate(lookups) if cached is None]
+        results = self.llm.batch(
+            [build_messages(cleaned_list[i]) for i in misses],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        ) if misses else []
+        recommendations = [cached for cached, _ in lookups]
+        for i, result in zip(misses, results):
+            if isinstance(result, Exception):
+                recommendations[i] = self._fail(cleaned_list[i], result)
+            else:
+                recommendations[i] = self._finish(cleaned_list[i], _response_text(result), lookups[i][1])
+        return recommendations
+
+    def _finish(self, cleaned_symptoms, response, embedding):
+        # Shared tail of every entry point: parse, fall back on a bad response, cache the rest.
+        logger.debug("Raw LLM response:\n%s", response)
+        try:
+            recommendation = self._parse_response(response)
+        except Exception as e:
+            return self._fail(cleaned_symptoms, e)
+        self._cache_store(cleaned_symptoms, recommendation, embedding)
+        return recommendation
+
+    def _fail(self, cleaned_symptoms, error):
+        # One line by default; the traceback only when debugging.
+        logger.warning("LLM call or parse failed: %s", error,
+                       exc_info=error if logger.isEnabledFor(logging.DEBUG) else None)
+        return self._fallback_recommendation(cleaned_symptoms, str(error))
+
+    def _invoke_with_retry(self, messages):
+        # Transient failures (network, rate limit, service) are retried with exponential backoff;
+        # anything else, or the last attempt's error, propagates to the fallback path.
+        for attempt in range(self.max_retries):
+            try:
+                return self.llm.invoke(messages)
+            except Exception as e:
+                delay = self._retry_delay_after(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _ainvoke_with_retry(self, messages):
+        for attempt in range(self.max_retries):
+            try:
+                return await self.llm.ainvoke(messages)
+            except Exception as e:
+                delay = self._retry_delay_after(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def _astream_with_retry(self, messages):
+        for attempt in range(self.max_retries):
+            try:
+                stream = self.llm.astream(messages).__aiter__()
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                delay = self._retry_delay_after(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            yield first
+            async for chunk in stream:
+                yield chunk
+            return
+
+    def _retry_delay_after(self, error, attempt):
+        if attempt + 1 >= self.max_retries or not categorize_error(error).retryable:
+            return None
+        # Jitter keeps clients that failed together from retrying in lockstep
+        delay = self.retry_delay * 2 ** attempt + random.uniform(0, self.retry_delay)
+        logger.warning("LLM call failed (%s); retrying in %.1fs (attempt %d/%d)", error, delay, attempt + 2, self.max_retries)
+        return delay
+
+    def _cache_lookup(self, cleaned_symptoms):
+        if self.cache is None:
+            return None, None
+        return self.cache.lookup(cleaned_symptoms)
+
+    def _cache_store(self, cleaned_symptoms, recommendation, embedding):
+        if self.cache is not None:
+            self.cache.store(cleaned_symptoms, recommendation, embedding)
 
     def _clean_input(self, symptoms):
-        if not symptoms or len(symptoms.strip()) < 3:
-            raise ValueError("Please provide more details about your symptoms")
-        cleaned = re.sub(r'\s+', ' ', symptoms.strip())
-        return cleaned[:1000]
+        return _clean_symptoms(symptoms)
 
     def _parse_response(self, response):
-        import re
-        import json
         # Remove Markdown code block if present
-        code_block = re.search(r'```(?:json)?\s*([\s\S]+?)\s*```', response)
+        code_block = _RE_CODE_BLOCK.search(response)
         if code_block:
             response = code_block.group(1)
-        # Try to extract the largest valid JSON substring
-        start = response.find('{')
-        end = response.rfind('}') + 1
-        if start == -1 or end == 0:
-            raise ValueError("No JSON found")
-        json_str = response[start:end]
+        json_str, cut = _extract_json(response)
         try:
-            data = json.loads(json_str)
+            data = _json_loads(json_str)
             incomplete = False
-        except json.JSONDecodeError:
-            # Try to recover from truncated JSON by trimming to the last complete brace
-            for i in range(len(json_str)-1, 0, -1):
-                if json_str[i] == '}':
-                    try:
-                        data = json.loads(json_str[:i+1])
-                        incomplete = True
-                        break
-                    except Exception:
-                        continue
-            else:
+        except ValueError:
+            # Truncated output: rewind to the last complete member and close the object there
+            if cut is None:
+                raise ValueError("Failed to parse response")
+            try:
+                data = _json_loads(json_str[:cut] + '}')
+            except ValueError:
                 raise ValueError("Failed to parse response")
+            incomplete = True
+            # Cut before the triage fields were complete: the fallback's keyword urgency is safer
+            # than showing a specialist with "Unknown" urgency.
+            if 'specialist' not in data or 'urgency' not in data:
+                raise ValueError("Truncated response is missing specialist or urgency")
         for field in ['specialist', 'reasoning', 'urgency']:
             if field not in data:
                 data[field] = "Unknown"
@@ -80,14 +305,16 @@ class ConsultationLLM:
         data.setdefault('additional_notes', '')
         if incomplete:
             data['additional_notes'] += " [Warning: Output may be incomplete due to truncation.]"
+            data['is_incomplete'] = True
         return data
 
     def _fallback_recommendation(self, symptoms, error):
-        urgency = "High" if any(word in symptoms.lower() for word in ['chest pain', 'breathing', 'severe', 'blood']) else "Medium"
+        urgency = _assess_basic_urgency(symptoms)
         return {
             "specialist": "General Physician",
             "reasoning": "Unable to analyze symptoms due to technical issue. A general physician can provide initial evaluation.",
             "urgency": urgency,
             "alternative": "Emergency Medicine (if severe)",
-            "additional_notes": "Seek immediate care for severe symptoms."
+            "additional_notes": "Seek immediate care for severe symptoms.",
+            "is_fallback": True
         }
\ No newline at end of file
@@ -1,6 +1,28 @@
-"""
-ConsentRight Phase 1 - Main Application
+"""ConsentRight Phase 1 - Main Application."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING, Any, Coroutine, Dict, Final, List, Optional
+from dotenv import load_dotenv
+from ui import StreamingResultDisplay, display_welcome, ask_continue, get_user_input
+from error_handling import _display_error_with_guidance
 
+# llm_handler (LangChain, Google GenAI SDK) and cache (sentence-transformers)
+# are slow to import, so they are imported inside the functions that need them.
+if TYPE_CHECKING:
+    from llm_handler import ConsultationLLM
+    from cache import ConsultationCache
+
+# The long-form notes are only kept in non-optimized runs; ``python -O`` drops
+# the whole block, so deployed processes don't carry the prose in memory.
+if __debug__:
+    _EDUCATIONAL_NOTES = """
 Terminal-based medical consultation prototype demonstrating LangChain integration
 with Google Gemini API for educational purposes.
 
@@ -42,120 +64,306 @@ Key Learning Objectives:
 - Input validation techniques
 """
 
-import os
-import sys
-import time
-import threading
-from typing import Dict, Any, Optional
-from dotenv import load_dotenv
-from llm_handler import ConsultationLLM
-from ui import display_welcome, display_result, ask_continue, get_user_input
-from error_handling import _display_error_with_guidance
+_STDOUT_IS_TTY = sys.stdout.isatty()
+
+# Error message prefixes, built once; print() adds the separating space and
+# writes the exception text itself instead of formatting an f-string per error
+_ERR_SEMANTIC_CACHE: Final = "⚠️  Semantic cache disabled:"
+_ERR_PERSISTENT_CACHE: Final = "⚠️  Persistent cache disabled:"
+_ERR_DETAILS: Final = "   Details:"
+_ERR_MAIN_LOOP: Final = "\n❌ Unexpected error in main loop:"
+_ERR_CRITICAL: Final = "\n❌ CRITICAL ERROR:"
+
+# Status lines shown before the spinner, written in one call
+_PROCESSING_MESSAGE: Final = (
+    "\nProcessing your symptoms...\n"
+    "   Analyzing symptoms and consulting medical knowledge base...\n"
+    "   Generating specialist recommendation...\n"
+)
 
+# Simple progress indicator, formatted once instead of on every frame
+_SPINNER_FRAMES = tuple(f"\r   {c} Please wait..." for c in "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏")
+_SPINNER_INTERVAL = 0.1  # seconds per frame
 
-def _show_processing_indicator() -> None:
+# Shared event loop for consultations, created on first use by _get_event_loop
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Consecutive processing failures, for progressive help in error guidance
+_error_count = 0
+
+
+def _get_llm(api_key: str) -> ConsultationLLM:
+    """
+    Create the consultation handler for the given API key.
+    
+    The handler is cheap to build: llm_handler keeps one LangChain client, and
+    its connection to Gemini, per API key and hands the same one to every
+    handler created with that key.
+    
+    Args:
+        api_key (str): Google Gemini API key
+        
+    Returns:
+        ConsultationLLM: Initialized consultation handler
+    """
+    # Imported only now, so a missing API key is reported without loading LangChain
+    from llm_handler import ConsultationLLM
+    
+    # Transient API failures are retried with exponential backoff (see .env.example)
+    return ConsultationLLM(
+        api_key,
+        max_retries=int(os.getenv('MAX_RETRIES', '3')),
+        retry_delay=float(os.getenv('RETRY_DELAY', '1.0'))
+    )
+
+
+def _init_cache(namespace: str) -> ConsultationCache:
+    """
+    Create the response cache used in front of the LLM.
+    
+    The exact-match tier is always on. PERSISTENT_CACHE keeps it on disk
+    (CACHE_PATH, default ~/.consentright/cache.sqlite) so repeats are answered
+    across restarts; results are kept for 30 days. The semantic tier is added
+    when SEMANTIC_CACHE is enabled: loading the embedding model takes a few
+    seconds and downloads it on first use, so it is opt-in. A failure in either
+    optional tier only disables that tier; it never stops the application.
+    
+    Args:
+        namespace (str): Prompt and model identity mixed into every cache key,
+            so results from another prompt version or model are never served
+    
+    Returns:
+        ConsultationCache: Ready cache, with or without the optional tiers
     """
-    Display a processing indicator with feedback.
+    from cache import CacheStore, ConsultationCache, SemanticCache
+    
+    persistent = None
+    if os.getenv('PERSISTENT_CACHE', 'false').lower() in ('1', 'true', 'yes'):
+        try:
+            persistent = CacheStore(os.path.expanduser(os.getenv('CACHE_PATH') or CacheStore.DEFAULT_PATH))
+        except Exception as e:
+            print(_ERR_PERSISTENT_CACHE, e, file=sys.stderr)
     
-    Shows progress to keep user engaged during API processing time.
+    semantic = None
+    if os.getenv('SEMANTIC_CACHE', 'false').lower() in ('1', 'true', 'yes'):
+        try:
+            threshold = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+            semantic = SemanticCache(threshold=threshold)
+            print("Semantic cache enabled.", file=sys.stderr)
+        except Exception as e:
+            print(_ERR_SEMANTIC_CACHE, e, file=sys.stderr)
+    return ConsultationCache(semantic=semantic, persistent=persistent, namespace=namespace)
+
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
     """
-    print("\nProcessing your symptoms...")
-    print("   Analyzing symptoms and consulting medical knowledge base...")
+    Return the application's event loop, creating it on first use.
     
-    # Simple progress indicator
-    indicators = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
+    The loop lives as long as the process, like llm_handler's shared clients:
+    the async Gemini client binds its connection to the loop that first used
+    it, so every consultation must run on the same loop.
     
-    # Show a brief animated indicator (2 seconds)
-    for i in range(20):  # 20 iterations * 0.1 seconds = 2 seconds
-        print(f"\r   {indicators[i % len(indicators)]} Please wait...", end="", flush=True)
-        time.sleep(0.1)
+    Returns:
+        asyncio.AbstractEventLoop: Shared event loop
+    """
+    global _event_loop
     
-    print("\r   Analysis in progress...                    ")
-    print("   Generating specialist recommendation...")
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_event_loop)
+    return _event_loop
 
 
-def _categorize_error(error: Exception) -> Dict[str, str]:
+def _run_async(coro: Coroutine[Any, Any, Any]) -> Any:
     """
-    Categorize errors to provide appropriate user-friendly messages.
+    Run a coroutine to completion on the shared event loop.
+    
+    Unlike ``asyncio.run`` this installs no SIGINT handler, so Ctrl+C still
+    raises KeyboardInterrupt for the interactive loop to handle. The
+    interrupted task is cancelled first, which also stops the spinner.
     
     Args:
-        error (Exception): The exception to categorize
+        coro (Coroutine): Coroutine to run
         
     Returns:
-        Dict[str, str]: Error category and user-friendly message
+        Any: The coroutine's result
+    """
+    loop = _get_event_loop()
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except BaseException:
+            pass
+        raise
+
+
+def _show_processing_indicator() -> asyncio.Task:
+    """
+    Display a processing indicator that runs alongside the API call.
+    
+    The spinner is a task on the running event loop, so it animates while the
+    request is awaited instead of delaying it by a fixed amount. Pass the
+    returned task to ``_stop_processing_indicator`` once output starts.
+    
+    Returns:
+        asyncio.Task: Spinner task
     """
-    error_str = str(error).lower()
-    
-    # Network and connectivity errors
-    if any(keyword in error_str for keyword in ['timeout', 'connection', 'network', 'unreachable']):
-        return {
-            "category": "network",
-            "message": "Network connection issue detected.",
-            "suggestions": [
-                "Check your internet connection",
-                "Try again in a few moments",
-                "Ensure you're not behind a restrictive firewall"
-            ]
-        }
-    
-    # API key and authentication errors
-    if any(keyword in error_str for keyword in ['api key', 'authentication', 'unauthorized', 'forbidden']):
-        return {
-            "category": "auth",
-            "message": "API authentication issue detected.",
-            "suggestions": [
-                "Verify your GEMINI_API_KEY in the .env file",
-                "Ensure your API key is valid and active",
-                "Check if your API key has the necessary permissions"
-            ]
-        }
-    
-    # Rate limiting errors
-    if any(keyword in error_str for keyword in ['rate limit', 'quota', 'too many requests']):
-        return {
-            "category": "rate_limit",
-            "message": "API rate limit exceeded.",
-            "suggestions": [
-                "Please wait a few minutes before trying again",
-                "Consider upgrading your API plan if this happens frequently",
-                "Try again with a shorter symptom description"
-            ]
-        }
-    
-    # Service availability errors
-    if any(keyword in error_str for keyword in ['service unavailable', 'server error', 'internal error']):
-        return {
-            "category": "service",
-            "message": "The AI service is temporarily unavailable.",
-            "suggestions": [
-                "This is likely a temporary issue with the AI service",
-                "Please try again in a few minutes",
-                "If the problem persists, consult a General Physician"
-            ]
-        }
-    
-    # Input validation errors
-    if any(keyword in error_str for keyword in ['invalid', 'validation', 'parse', 'format']):
-        return {
-            "category": "input",
-            "message": "There was an issue processing your symptom description.",
-            "suggestions": [
-                "Try rephrasing your symptoms more clearly",
-                "Avoid special characters or very long descriptions",
-                "Focus on the main symptoms you're experiencing"
-            ]
-        }
-    
-    # Generic/unknown errors
-    return {
-        "category": "unknown",
-        "message": "An unexpected error occurred during processing.",
-        "suggestions": [
-            "Please try again with a different symptom description",
-            "If the problem persists, restart the application",
-            "Consider consulting a General Physician if you need immediate help"
-        ]
-    }
+    sys.stdout.write(_PROCESSING_MESSAGE)
+    sys.stdout.flush()
+    
+    return asyncio.create_task(_run_spinner())
+
+
+async def _run_spinner() -> None:
+    """
+    Animate the processing indicator until the task is cancelled.
+    """
+    # Each frame is a flushed write, so skip the animation when output is
+    # piped or logged rather than shown on a terminal.
+    if not _STDOUT_IS_TTY:
+        return
+    
+    loop = asyncio.get_running_loop()
+    write = sys.stdout.write
+    flush = sys.stdout.flush
+    i = 0
+    # Frames are scheduled against fixed deadlines, so sleep overshoot on one
+    # frame is absorbed by the next instead of accumulating.
+    start = loop.time()
+    while True:
+        write(_SPINNER_FRAMES[i % len(_SPINNER_FRAMES)])
+        flush()
+        i += 1
+        await asyncio.sleep(max(0.0, start + i * _SPINNER_INTERVAL - loop.time()))
+
+
+def _stop_processing_indicator(spinner: asyncio.Task) -> None:
+    """
+    Stop the processing indicator and clear its line.
+    
+    Cancelling takes effect at the spinner's next await, and it never writes
+    between awaits, so the line can be cleared right away.
+    
+    Args:
+        spinner (asyncio.Task): Task returned by ``_show_processing_indicator``
+    """
+    spinner.cancel()
+    if _STDOUT_IS_TTY:
+        print("\r" + " " * 40 + "\r", end="", flush=True)
+
+
+async def _stream_consultation(consultation_llm: ConsultationLLM, symptoms: str) -> Dict[str, Any]:
+    """
+    Run a consultation, displaying each result field as it streams in.
+    
+    The processing message and spinner appear only once the handler's cache
+    has missed, and cover only the wait for the first token (including any
+    retries). After that, ``StreamingResultDisplay`` prints every field of the
+    JSON response the moment its value is complete, so the recommended
+    specialist appears at first-token latency instead of after the full
+    response; anything that did not stream cleanly, or a result answered from
+    the handler's cache, is shown at the end from the parsed result.
+    
+    Args:
+        consultation_llm (ConsultationLLM): Initialized consultation handler
+        symptoms (str): Validated symptom description
+        
+    Returns:
+        Dict[str, Any]: Parsed recommendation, or the fallback on failure
+    """
+    spinner: Optional[asyncio.Task] = None
+    display = StreamingResultDisplay()
+    
+    def on_miss() -> None:
+        nonlocal spinner
+        spinner = _show_processing_indicator()
+    
+    def on_chunk(text: str) -> None:
+        nonlocal spinner
+        if spinner is not None:
+            _stop_processing_indicator(spinner)
+            spinner = None
+        display.feed(text)
+    
+    try:
+        result = await consultation_llm.astream_symptoms(symptoms, on_chunk, on_miss)
+    finally:
+        if spinner is not None:
+            _stop_processing_indicator(spinner)
+    display.finish(result)
+    return result
+
+
+def _parse_args() -> argparse.Namespace:
+    """
+    Parse command-line options.
+    
+    Returns:
+        argparse.Namespace: Parsed options (``batch``, ``concurrency`` and ``cache``)
+    """
+    parser = argparse.ArgumentParser(description="ConsentRight medical specialist recommendations")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="process one symptom description per line of FILE and write JSONL results to stdout")
+    parser.add_argument('--concurrency', metavar='N', type=int, default=8,
+                        help="maximum concurrent requests in batch mode (default: 8)")
+    parser.add_argument('--cache', action='store_true',
+                        help="reuse earlier results for repeated or paraphrased lines in batch mode "
+                             "(off by default so evaluations are reproducible)")
+    return parser.parse_args()
+
+
+async def _process_batch(consultation_llm: ConsultationLLM, lines: List[str], concurrency: int) -> List[Any]:
+    """
+    Run consultations for many symptom descriptions concurrently.
+    
+    The workload is network-bound, so overlapping the requests gives far more
+    throughput than the interactive loop; the semaphore keeps the number of
+    in-flight requests under the API rate limit.
+    
+    Args:
+        consultation_llm (ConsultationLLM): Initialized consultation handler
+        lines (List[str]): Symptom descriptions, one per consultation
+        concurrency (int): Maximum number of requests in flight
+        
+    Returns:
+        List[Any]: One result dict or exception per input line, in order
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def one(symptoms: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await consultation_llm.aprocess_symptoms(symptoms)
+    
+    return await asyncio.gather(*[one(s) for s in lines], return_exceptions=True)
+
+
+def _run_batch(consultation_llm: ConsultationLLM, path: str, concurrency: int) -> None:
+    """
+    Batch mode: process every non-blank line of ``path`` and print JSONL.
+    
+    Each output line holds the input symptoms and either the recommendation
+    or the error that prevented one, so a single bad line never stops the run.
+    
+    Args:
+        consultation_llm (ConsultationLLM): Initialized consultation handler
+        path (str): Text file with one symptom description per line
+        concurrency (int): Maximum number of requests in flight
+    """
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    
+    results = _run_async(_process_batch(consultation_llm, lines, concurrency))
+    for symptoms, result in zip(lines, results):
+        if isinstance(result, Exception):
+            record = {"symptoms": symptoms, "error": str(result)}
+        else:
+            record = {"symptoms": symptoms, "result": result}
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
 
 
 def main() -> None:
@@ -165,9 +373,18 @@ def main() -> None:
     Handles environment setup, LLM initialization, and manages the continuous
     consultation loop with proper error handling and user experience.
     """
+    global _error_count
+    
+    args = _parse_args()
+    
     try:
-        # Load environment variables from .env file
-        load_dotenv()
+        # Load environment variables from .env file, unless the deployment already
+        # injects the API key (then the rest of the settings come from the environment too)
+        if not os.getenv('GEMINI_API_KEY'):
+            load_dotenv()
+        
+        # Diagnostics from llm_handler go through logging; LOG_LEVEL=DEBUG adds raw LLM responses and failure tracebacks
+        logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper())
         
         # Get API key from environment
         api_key = os.getenv('GEMINI_API_KEY')
@@ -182,20 +399,38 @@ def main() -> None:
         
         # EDUCATIONAL: Initialize the LLM handler
         # This demonstrates proper LangChain initialization with error handling
-        print("Initializing AI consultation system...")
+        # In batch mode stdout carries only JSONL results
+        if not args.batch:
+            print("Initializing AI consultation system...")
         try:
-            # Create our ConsultationLLM instance - this sets up the LangChain components
-            consultation_llm = ConsultationLLM(api_key)
-            print("System ready!")
+            # Get our ConsultationLLM instance - this sets up the LangChain components once
+            consultation_llm = _get_llm(api_key)
+            if not args.batch:
+                print("System ready!")
         except Exception as e:
-            print(f"\n❌ ERROR: Failed to initialize consultation system.")
-            print(f"   Details: {str(e)}")
+            print("\n❌ ERROR: Failed to initialize consultation system.")
+            print(_ERR_DETAILS, e)
             print("\nPlease check:")
             print("• Your internet connection")
             print("• Your GEMINI_API_KEY is valid")
             print("• All dependencies are installed (pip install -r requirements.txt)")
             sys.exit(1)
         
+        # Batch mode replaces the interactive session entirely
+        if args.batch:
+            consultation_llm.cache = _init_cache(consultation_llm.cache_namespace) if args.cache else None
+            _run_batch(consultation_llm, args.batch, args.concurrency)
+            return
+        
+        # Repeated symptoms are answered from the cache inside the handler; with
+        # SEMANTIC_CACHE enabled, paraphrased symptoms reuse an earlier recommendation too
+        if consultation_llm.cache is None:
+            consultation_llm.cache = _init_cache(consultation_llm.cache_namespace)
+        
+        # Open the connection the streamed consultations use, on the same loop, so the
+        # first one skips the handshake; bounded so a slow network barely delays startup
+        _run_async(consultation_llm.awarmup())
+        
         # Display welcome message
         display_welcome()
         
@@ -205,22 +440,16 @@ def main() -> None:
                 # Get user input (symptoms)
                 symptoms = get_user_input()
                 
-                # Show enhanced processing indicator with progress
-                _show_processing_indicator()
-                
                 # EDUCATIONAL: Process symptoms through LLM with comprehensive error handling
                 # This shows how to integrate LangChain processing into a user application
                 try:
-                    # Call our LangChain-based processing method
-                    # This executes: input validation → prompt formatting → LLM call → response parsing
-                    result = consultation_llm.process_symptoms(symptoms)
+                    # Call our LangChain-based processing method, streaming the response
+                    # This executes: input validation → cache lookup → prompt formatting → LLM call → response parsing
+                    # The structured results are displayed field by field as they arrive
+                    result = _run_async(_stream_consultation(consultation_llm, symptoms))
                     
                     # Reset error count on successful processing (for progressive help)
-                    if hasattr(main, '_error_count'):
-                        main._error_count = 0
-                    
-                    # Display the structured results to the user
-                    display_result(result)
+                    _error_count = 0
                     
                 except KeyboardInterrupt:
                     print("\n\n⚠️  Processing interrupted by user (Ctrl+C)")
@@ -228,12 +457,10 @@ def main() -> None:
                     continue
                 except Exception as e:
                     # Track consecutive errors for progressive help
-                    if not hasattr(main, '_error_count'):
-                        main._error_count = 0
-                    main._error_count += 1
+                    _error_count += 1
                     
                     # Display categorized error with helpful guidance
-                    _display_error_with_guidance(e, main._error_count)
+                    _display_error_with_guidance(e, _error_count)
                     
                     # Ask if user wants to try again
                     try:
@@ -261,7 +488,7 @@ def main() -> None:
                 print("Exiting gracefully...")
                 break
             except Exception as e:
-                print(f"\n❌ Unexpected error in main loop: {str(e)}")
+                print(_ERR_MAIN_LOOP, e)
                 print("💡 This might be a system-level issue. Please:")
                 print("   • Restart the application")
                 print("   • Check your system resources")
@@ -280,7 +507,7 @@ def main() -> None:
         print("Stay healthy!")
         
     except Exception as e:
-        print(f"\n❌ CRITICAL ERROR: {str(e)}")
+        print(_ERR_CRITICAL, e)
         print("Please check your setup and try again.")
         sys.exit(1)
 
@@ -1,39 +1,56 @@
-from langchain.prompts import PromptTemplate
-SPECIALIST_LIST = [
+import re
+SPECIALIST_LIST = (
     "Cardiologist", "Neurologist", "Dermatologist", "Gastroenterologist",
     "Orthopedist", "Psychiatrist", "ENT", "Ophthalmologist",
     "Gynecologist", "General Physician", "Emergency Medicine", "Rheumatologist"
-]
-CONSULTATION_PROMPT = PromptTemplate(
-    input_variables=["symptoms"],
-    template=f"""
-You are a medical consultation AI assistant that helps users identify which medical specialist they should consult based on their symptoms.
+)
+# Constant-time membership for checking the model's answer, and the joined form for prompts.
+SPECIALIST_SET = frozenset(SPECIALIST_LIST)
+# Finds a listed specialist inside a decorated answer such as "Cardiologist (heart specialist)".
+SPECIALIST_RE = re.compile(r'\b(' + '|'.join(map(re.escape, sorted(SPECIALIST_LIST, key=len, reverse=True))) + r')\b', re.IGNORECASE)
+_SPECIALIST_BY_LOWER = {name.lower(): name for name in SPECIALIST_LIST}
+SPECIALIST_LIST_STR = ', '.join(SPECIALIST_LIST)
+# Rendered once at import; only the symptoms change per request, so a prompt is
+# just prefix + symptoms + suffix rather than a template substitution.
+CONSULTATION_TEMPLATE = f"""You are a medical consultation AI assistant that helps users identify which medical specialist they should consult based on their symptoms.
 
-Available specialists: {', '.join(SPECIALIST_LIST)}
+Available specialists: {SPECIALIST_LIST_STR}
 
 Your task is to analyze the provided symptoms and recommend the most appropriate specialist, along with reasoning and urgency level.
 
 Please respond ONLY with valid JSON. Do not include any text, explanation, or formatting outside the JSON object.
 If you cannot answer, return:
-{{{{
-  \"specialist\": \"Unknown\",
-  \"reasoning\": \"Unknown\",
-  \"urgency\": \"Unknown\",
-  \"alternative\": \"\",
-  \"additional_notes\": \"\"
-}}}}
+{{\"specialist\":\"Unknown\",\"reasoning\":\"Unknown\",\"urgency\":\"Unknown\",\"alternative\":\"\",\"additional_notes\":\"\"}}
 
 Respond in the following JSON format:
-{{{{
+{{
   \"specialist\": \"Primary recommended specialist from the list\",
   \"reasoning\": \"Clear explanation for why this specialist is recommended\",
   \"urgency\": \"High/Medium/Low - urgency level based on symptoms\",
   \"alternative\": \"Alternative specialist if applicable (optional)\",
   \"additional_notes\": \"Any extra guidance or recommendations (optional)\"
-}}}}
+}}
 
 Keep your response as short as possible, but always return a complete JSON object.
 
 Symptoms: {{symptoms}}
 """
-)
\ No newline at end of file
+_PROMPT_PREFIX = CONSULTATION_TEMPLATE.split("{symptoms}")[0]
+# Chat form of the same prompt: everything static goes in the system instruction and the
+# user turn carries only the symptoms, so per-request input is just "Symptoms: ...".
+_SYMPTOMS_LABEL = "Symptoms: "
+SYSTEM_PROMPT = _PROMPT_PREFIX[:-len(_SYMPTOMS_LABEL)].strip()
+
+def canonical_specialist(answer):
+    # Exact names are the common case; otherwise take the first listed name the answer mentions.
+    # Non-strings (the model may return a list) are checked first: a list is not hashable.
+    if not isinstance(answer, str):
+        return None
+    if answer in SPECIALIST_SET:
+        return answer
+    match = SPECIALIST_RE.search(answer)
+    return _SPECIALIST_BY_LOWER[match.group(1).lower()] if match else None
+
+def build_messages(symptoms):
+    # (role, content) pairs are accepted directly by LangChain chat models.
+    return [("system", SYSTEM_PROMPT), ("human", _SYMPTOMS_LABEL + symptoms)]
@@ -1,28 +1,112 @@
+import json
+import re
 import sys
+from prompts import canonical_specialist
+
+# Completed "field": "string value" pairs in the model's JSON output.
+_STREAM_FIELD_RE = re.compile(r'"(specialist|urgency|reasoning|alternative|additional_notes)"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+_BAR = "=" * 60
+_DASH = "-" * 60
+
+# Fixed banners, formatted once and each written with a single call.
+_WELCOME_BANNER = (
+    f"\n{_BAR}\n"
+    "Welcome to ConsentRight - Medical Consultation Assistant\n"
+    f"{_BAR}\n"
+    "\nDescribe your symptoms in detail. Type 'quit' or 'exit' to end.\n"
+    f"{_DASH}\n"
+)
+_RESULT_HEADER = f"\n{_BAR}\nCONSULTATION RESULT\n{_BAR}"
+_RESULT_FOOTER = f"\n{_DASH}\nIMPORTANT: This is AI-generated. Consult a healthcare professional.\n{_DASH}"
+# Closes a streamed block whose response failed part way, before the fallback result is shown.
+_INTERRUPTED_FOOTER = (
+    f"\n{_DASH}\n"
+    "RESPONSE INTERRUPTED: the partial output above is unreliable; disregard it.\n"
+    "The fallback recommendation below replaces it.\n"
+    f"{_DASH}"
+)
 
 def display_welcome():
-    print("\n" + "="*60)
-    print("Welcome to ConsentRight - Medical Consultation Assistant")
-    print("="*60)
-    print("\nDescribe your symptoms in detail. Type 'quit' or 'exit' to end.")
-    print("-"*60)
+    sys.stdout.write(_WELCOME_BANNER)
+    sys.stdout.flush()
 
 def display_result(result):
-    print("\n" + "="*60)
-    print("CONSULTATION RESULT")
-    print("="*60)
-    print(f"\nRECOMMENDED SPECIALIST: {result.get('specialist', 'Unknown')}")
-    print(f"URGENCY LEVEL: {result.get('urgency', 'Medium')}")
-    print(f"\nREASONING:\n   {result.get('reasoning', 'No reasoning provided')}")
-    alt = result.get('alternative', '')
-    if alt and alt.strip():
-        print(f"\nALTERNATIVE SPECIALIST: {alt}")
-    notes = result.get('additional_notes', '')
-    if notes and notes.strip():
-        print(f"\nADDITIONAL NOTES:\n   {notes}")
-    print("\n" + "-"*60)
-    print("IMPORTANT: This is AI-generated. Consult a healthcare professional.")
-    print("-"*60)
+    specialist = _checked_specialist(result.get('specialist') or 'Unknown')
+    urgency = result.get('urgency') or 'Medium'
+    reasoning = result.get('reasoning') or 'No reasoning provided'
+    alt = (result.get('alternative') or '').strip()
+    notes = (result.get('additional_notes') or '').strip()
+    lines = [
+        _RESULT_HEADER,
+        f"\nRECOMMENDED SPECIALIST: {specialist}",
+        f"URGENCY LEVEL: {urgency}",
+        f"\nREASONING:\n   {reasoning}",
+    ]
+    if alt:
+        lines.append(f"\nALTERNATIVE SPECIALIST: {alt}")
+    if notes:
+        lines.append(f"\nADDITIONAL NOTES:\n   {notes}")
+    lines.append(_RESULT_FOOTER)
+    # One write to the terminal instead of one per line (print would add a second for the newline).
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+def _checked_specialist(specialist):
+    # A listed name wrapped in extra words is shown as just that name; anything naming no
+    # listed specialist (hallucinated, misspelled, or "Unknown") is shown as the general fallback.
+    return canonical_specialist(specialist) or "General Physician"
+
+def _display_field(name, value, previous=None):
+    if name == 'specialist':
+        print(f"\nRECOMMENDED SPECIALIST: {_checked_specialist(value)}")
+    elif name == 'urgency':
+        # Sits right under the specialist line, as in display_result; otherwise gets its own block.
+        prefix = "" if previous == 'specialist' else "\n"
+        print(f"{prefix}URGENCY LEVEL: {value}")
+    elif name == 'reasoning':
+        print(f"\nREASONING:\n   {value}")
+    elif value and value.strip():
+        label = "ALTERNATIVE SPECIALIST: " if name == 'alternative' else "ADDITIONAL NOTES:\n   "
+        print(f"\n{label}{value}")
+
+class StreamingResultDisplay:
+    # Prints each field of the JSON response as soon as its value is complete, so the
+    # recommendation shows up while the rest of the response is still streaming.
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._shown = set()
+        self._last = None
+
+    def feed(self, text):
+        self._buffer += text
+        for match in _STREAM_FIELD_RE.finditer(self._buffer, self._pos):
+            self._pos = match.end()
+            name = match.group(1)
+            if name in self._shown:
+                continue
+            if not self._shown:
+                print(_RESULT_HEADER)
+            self._shown.add(name)
+            _display_field(name, json.loads(match.group(2)), self._last)
+            self._last = name
+
+    def finish(self, result):
+        # Nothing usable streamed (or the call failed): show the final result the usual way.
+        if result.get('is_fallback'):
+            if self._shown:
+                print(_INTERRUPTED_FOOTER)
+            display_result(result)
+            return
+        if not self._shown:
+            display_result(result)
+            return
+        for name in ('specialist', 'urgency', 'reasoning', 'alternative', 'additional_notes'):
+            if name not in self._shown:
+                _display_field(name, result.get(name, ''), self._last)
+                self._last = name
+        print(_RESULT_FOOTER)
 
 def ask_continue():
     while True:
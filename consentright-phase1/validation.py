@@ -1,10 +1,18 @@
 import re
+import string
+from collections import Counter
+
+_DROP_LETTERS = str.maketrans('', '', string.ascii_letters)
+_RE_ALLOWED = re.compile(r'^[a-zA-Z0-9\s\.,;:!\-\'"()\[\]/+*&%$#@]+$')
+# The same characters as _RE_ALLOWED minus non-ASCII whitespace, which only the regex handles.
+_ALLOWED_CHARS = frozenset(string.ascii_letters + string.digits + string.whitespace + '.,;:!-\'"()[]/+*&%$#@')
+
 def validate_symptom_input(user_input):
     result = {"valid": False, "cleaned_input": "", "error_message": ""}
-    if not user_input or len(user_input.strip()) == 0:
+    cleaned = user_input.strip() if user_input else ""
+    if not cleaned:
         result["error_message"] = "Please enter a description of your symptoms."
         return result
-    cleaned = user_input.strip()
     if len(cleaned) < 5:
         result["error_message"] = "Please provide a more detailed description (at least 5 characters)."
         return result
@@ -14,26 +22,33 @@ def validate_symptom_input(user_input):
     if has_excessive_repetition(cleaned):
         result["error_message"] = "Please avoid excessive repetition."
         return result
-    if not re.match(r'^[a-zA-Z0-9\s\.,;:!\-\'"()\[\]/+*&%$#@]+$', cleaned):
+    # Plain ASCII input passes the set check without entering the regex engine.
+    if not _ALLOWED_CHARS.issuperset(cleaned) and not _RE_ALLOWED.match(cleaned):
         result["error_message"] = "Use only standard characters."
         return result
-    cleaned = re.sub(r'\s+', ' ', cleaned)
-    if not re.search(r'[a-zA-Z]', cleaned):
+    # Nothing removed means there was no letter to remove.
+    if cleaned.translate(_DROP_LETTERS) == cleaned:
         result["error_message"] = "Include descriptive text about your symptoms."
         return result
+    cleaned = normalize_whitespace(cleaned)
     result["valid"] = True
     result["cleaned_input"] = cleaned
     return result
 
+def normalize_whitespace(text):
+    # Strip and collapse whitespace runs. Already-clean text (no double spaces; isprintable()
+    # is False for every other whitespace character) skips the split/join copy.
+    text = text.strip()
+    if '  ' in text or not text.isprintable():
+        return ' '.join(text.split())
+    return text
+
 def has_excessive_repetition(text):
-    if re.search(r'(.)\1{4,}', text):
+    # A run of 5+ identical characters other than newline (what (.)\1{4,} matched), found with
+    # one C substring search per distinct character instead of a backtracking backreference regex.
+    if any(c * 5 in text for c in set(text).difference('\n')):
         return True
-    words = text.lower().split()
-    word_counts = {}
-    for word in words:
-        if len(word) > 2:
-            word_counts[word] = word_counts.get(word, 0) + 1
-            if word_counts[word] > 10:
-                return True
-    return False
+    # Counter tallies the whole split list in C; short words are filtered on the (fewer) distinct keys.
+    word_counts = Counter(text.lower().split())
+    return any(count > 10 and len(word) > 2 for word, count in word_counts.items())
 